@@ -0,0 +1,352 @@
+"""
+Maintenance commands for the knowledge inbox.
+
+Usage:
+    python admin.py reconcile [--dry-run] [--page-size N] [--batch-size N]
+    python admin.py stats
+    python admin.py rebuild [--m N] [--ef-construction N] [--ef-search N]
+                            [--model NAME] [--batch-size N] [--drop-old]
+    python admin.py bench-scoped [--chunks N ...] [--chunks-per-item N] [--queries N]
+    python admin.py compress-content
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from sentence_transformers import SentenceTransformer
+from database import db
+from rag_pipeline import rag, COLLECTION_REFRESH_SECONDS, DEFAULT_COLLECTION, DEFAULT_EMBEDDING_MODEL
+from outbox import replay_outbox
+from logger import logger
+
+def _batched(values: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def reconcile(page_size: int = 1000, batch_size: int = 50, dry_run: bool = False) -> Dict:
+    """
+    Converge SQLite and Chroma: purge chunks whose item no longer exists and
+    re-index items that have no chunks.
+    """
+    outbox = replay_outbox()
+
+    # Scan Chroma before SQLite so an item ingested mid-scan shows up as
+    # "missing" (harmless re-index) rather than as an orphan to purge.
+    indexed_ids = set(rag.iter_parent_doc_ids(page_size))
+    item_ids = set(db.iter_item_ids(page_size))
+    in_flight = db.get_pending_item_ids()
+
+    orphans = sorted(indexed_ids - item_ids - in_flight)
+    missing = sorted(item_ids - indexed_ids - in_flight)
+    logger.info(
+        f"Reconcile: {len(item_ids)} items, {len(indexed_ids)} indexed, "
+        f"{len(orphans)} orphaned, {len(missing)} missing"
+    )
+
+    purged = reindexed = 0
+    if not dry_run:
+        for batch in _batched(orphans, batch_size):
+            rag.delete_documents(batch)
+            purged += len(batch)
+        for batch in _batched(missing, batch_size):
+            rag.add_documents(db.get_items_by_ids(batch))
+            reindexed += len(batch)
+
+    return {
+        "outbox": outbox,
+        "items": len(item_ids),
+        "indexed": len(indexed_ids),
+        "orphaned": len(orphans),
+        "missing": len(missing),
+        "purged": purged,
+        "reindexed": reindexed,
+        "dry_run": dry_run
+    }
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def _index_disk_bytes(collection) -> int:
+    """Size of the collection's own HNSW segment directory under the persist path."""
+    conn = sqlite3.connect(os.path.join(rag.persist_path, "chroma.sqlite3"))
+    rows = conn.execute(
+        "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'",
+        (str(collection.id),)
+    ).fetchall()
+    conn.close()
+    return sum(_dir_size(os.path.join(rag.persist_path, segment_id)) for (segment_id,) in rows)
+
+def _iter_ids(collection, page_size: int = 1000) -> Iterator[str]:
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page['ids']:
+            return
+        yield from page['ids']
+        offset += len(page['ids'])
+
+def index_stats(collection=None, samples: int = 50) -> Dict:
+    """Report size and query latency of a collection (the active one by default)."""
+    if collection is None:
+        collection = rag.collection
+
+    # Probe with stored vectors so the timing covers the ANN search only
+    probe = collection.get(include=["embeddings"], limit=samples)
+    latencies = []
+    for embedding in probe['embeddings'] or []:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[embedding], n_results=rag.top_k, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    def percentile(p: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+    return {
+        "collection": collection.name,
+        "metadata": collection.metadata,
+        "chunks": collection.count(),
+        "index_disk_bytes": _index_disk_bytes(collection),
+        "query_ms_p50": percentile(0.50),
+        "query_ms_p95": percentile(0.95)
+    }
+
+def _copy_chunks(source, target, ids: List[str], encoder: Optional[SentenceTransformer]):
+    include = ["documents", "metadatas"] if encoder else ["embeddings", "documents", "metadatas"]
+    page = source.get(ids=ids, include=include)
+    if not page['ids']:
+        return
+    embeddings = encoder.encode(page['documents']).tolist() if encoder else page['embeddings']
+    target.upsert(
+        ids=page['ids'],
+        embeddings=embeddings,
+        documents=page['documents'],
+        metadatas=page['metadatas']
+    )
+
+def _sync_collections(source, target, batch_size: int, encoder: Optional[SentenceTransformer]) -> Dict[str, int]:
+    """Copy chunks missing from target and drop chunks gone from source."""
+    source_ids = set(_iter_ids(source))
+    target_ids = set(_iter_ids(target))
+    missing = sorted(source_ids - target_ids)
+    stale = sorted(target_ids - source_ids)
+    for batch in _batched(missing, batch_size):
+        _copy_chunks(source, target, batch, encoder)
+    for batch in _batched(stale, batch_size):
+        target.delete(ids=batch)
+    return {"copied": len(missing), "removed": len(stale)}
+
+def _wait_for_intents(up_to_id: int, timeout: float = 600, poll: float = 1.0):
+    deadline = time.monotonic() + timeout
+    while db.count_leased_intents(up_to_id):
+        if time.monotonic() > deadline:
+            logger.warning(f"Intents up to {up_to_id} still pending after {timeout}s; reconciling anyway")
+            return
+        time.sleep(poll)
+
+def rebuild(m: int = 16, ef_construction: int = 100, ef_search: int = 10, model_name: Optional[str] = None,
+            batch_size: int = 256, drop_old: bool = False) -> Dict:
+    """
+    Rebuild the active collection into a fresh one and swap it in.
+
+    Copying into a new collection leaves deleted-chunk tombstones behind and
+    applies the given HNSW parameters. If model_name differs from the model
+    the current vectors came from, every chunk is re-embedded. The service
+    keeps serving the old collection until the swap; writes that still reach
+    the old collection around the swap are repaired from SQLite afterwards.
+    """
+    before = index_stats()
+    source = rag.collection
+    source_model = (source.metadata or {}).get("embedding_model", DEFAULT_EMBEDDING_MODEL)
+    target_model = model_name or source_model
+    encoder = SentenceTransformer(target_model) if target_model != source_model else None
+
+    name = f"{DEFAULT_COLLECTION}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+    target = rag.chroma_client.create_collection(
+        name=name,
+        metadata={
+            "hnsw:space": "cosine",
+            "hnsw:M": m,
+            "hnsw:construction_ef": ef_construction,
+            "hnsw:search_ef": ef_search,
+            "embedding_model": target_model
+        }
+    )
+    logger.info(f"Rebuilding {source.name} into {name} ({'re-embedding with ' + target_model if encoder else 'copying vectors'})")
+
+    try:
+        offset = copied = 0
+        while True:
+            page = source.get(include=[], limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+            _copy_chunks(source, target, page['ids'], encoder)
+            copied += len(page['ids'])
+            offset += len(page['ids'])
+            logger.info(f"Rebuild progress: {copied} chunks")
+
+        # Catch up on writes that landed while copying, then swap
+        catch_up = _sync_collections(source, target, batch_size, encoder)
+    except Exception as e:
+        logger.error(f"Rebuild failed, dropping {name}: {str(e)}")
+        rag.chroma_client.delete_collection(name)
+        raise
+    swap_intent_id = db.get_latest_intent_id()
+    db.set_setting("active_collection", name)
+
+    # The target is live from here on, so never diff it against the source:
+    # chunks only in target are new ingests, chunks only in source may be
+    # deletes. Wait for services to pick up the swap and for writes begun
+    # before it to finish, then converge the new collection on SQLite.
+    time.sleep(COLLECTION_REFRESH_SECONDS * 2)
+    _wait_for_intents(swap_intent_id)
+    final_sync = reconcile(batch_size=batch_size)
+
+    if drop_old:
+        rag.chroma_client.delete_collection(source.name)
+        logger.info(f"Dropped collection {source.name}")
+
+    return {
+        "before": before,
+        "after": index_stats(target),
+        "copied": copied,
+        "catch_up": catch_up,
+        "final_sync": final_sync
+    }
+
+def _p50_ms(timings: List[float]) -> float:
+    return round(sorted(timings)[len(timings) // 2] * 1000, 3)
+
+def bench_scoped(sizes: List[int], chunks_per_item: int = 40, queries: int = 200, dim: int = 384) -> List[Dict]:
+    """
+    Compare item-scoped retrieval via filtered ANN against the exact
+    per-item fast path on throwaway in-memory collections of random vectors.
+    """
+    rng = np.random.default_rng(0)
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    reports = []
+    for size in sizes:
+        name = f"bench_scoped_{size}"
+        collection = client.create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        for start in range(0, size, 5000):
+            count = min(5000, size - start)
+            collection.add(
+                ids=[f"chunk_{i}" for i in range(start, start + count)],
+                embeddings=rng.standard_normal((count, dim), dtype=np.float32).tolist(),
+                documents=[f"chunk {i}" for i in range(start, start + count)],
+                metadatas=[{"parent_doc_id": f"item_{i // chunks_per_item}"} for i in range(start, start + count)]
+            )
+
+        items = max(1, size // chunks_per_item)
+        ann_times, cold_times, warm_times = [], [], []
+        hits = 0
+        for _ in range(queries):
+            item_id = f"item_{rng.integers(items)}"
+            query = rng.standard_normal((1, dim), dtype=np.float32).tolist()
+
+            start = time.perf_counter()
+            ann = collection.query(query_embeddings=query, n_results=rag.top_k, where={"parent_doc_id": item_id})
+            ann_times.append(time.perf_counter() - start)
+
+            rag._invalidate_items([item_id])
+            start = time.perf_counter()
+            exact = rag.query_item_chunks(collection, query, item_id)
+            cold_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            rag.query_item_chunks(collection, query, item_id)
+            warm_times.append(time.perf_counter() - start)
+
+            hits += len(set(ann['documents'][0]) & set(exact['documents'][0]))
+
+        client.delete_collection(name)
+        reports.append({
+            "chunks": size,
+            "filtered_ann_ms_p50": _p50_ms(ann_times),
+            "exact_cold_ms_p50": _p50_ms(cold_times),
+            "exact_cached_ms_p50": _p50_ms(warm_times),
+            "ann_recall_at_k": round(hits / (queries * rag.top_k), 4)
+        })
+        logger.info(f"Scoped query benchmark at {size} chunks: {reports[-1]}")
+    return reports
+
+def storage_stats() -> Dict:
+    """Report SQLite file size and items list latency."""
+    start = time.perf_counter()
+    items = db.get_all_items()
+    list_ms = (time.perf_counter() - start) * 1000
+    return {
+        "items": len(items),
+        "db_bytes": os.path.getsize(db.db_path),
+        "list_items_ms": round(list_ms, 3)
+    }
+
+def compress_content(batch_size: int = 500) -> Dict:
+    """Rewrite stored item content with the current codec and report the savings."""
+    before = storage_stats()
+    rewritten = db.recompress_items(batch_size=batch_size)
+    return {"before": before, "after": storage_stats(), "rewritten": rewritten}
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Knowledge Inbox maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reconcile_parser = subparsers.add_parser("reconcile", help="Repair drift between SQLite and the vector store")
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="Report drift without changing anything")
+    reconcile_parser.add_argument("--page-size", type=int, default=1000, help="Ids read per page")
+    reconcile_parser.add_argument("--batch-size", type=int, default=50, help="Items purged or re-indexed per batch")
+
+    subparsers.add_parser("stats", help="Report vector index size and query latency")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the vector index into a fresh collection and swap it in")
+    rebuild_parser.add_argument("--m", type=int, default=16, help="HNSW graph degree (hnsw:M)")
+    rebuild_parser.add_argument("--ef-construction", type=int, default=100, help="HNSW build-time candidate list size")
+    rebuild_parser.add_argument("--ef-search", type=int, default=10, help="HNSW query-time candidate list size")
+    rebuild_parser.add_argument("--model", default=None, help="Re-embed every chunk with this sentence-transformers model")
+    rebuild_parser.add_argument("--batch-size", type=int, default=256, help="Chunks copied or embedded per batch")
+    rebuild_parser.add_argument("--drop-old", action="store_true", help="Delete the previous collection after the swap")
+
+    bench_parser = subparsers.add_parser("bench-scoped", help="Benchmark item-scoped retrieval paths")
+    bench_parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000], help="Collection sizes to test")
+    bench_parser.add_argument("--chunks-per-item", type=int, default=40, help="Chunks per synthetic item")
+    bench_parser.add_argument("--queries", type=int, default=200, help="Queries per collection size")
+
+    compress_parser = subparsers.add_parser("compress-content", help="Compress stored item content written by older versions")
+    compress_parser.add_argument("--batch-size", type=int, default=500, help="Rows rewritten per transaction")
+
+    args = parser.parse_args()
+
+    if args.command == "reconcile":
+        report = reconcile(page_size=args.page_size, batch_size=args.batch_size, dry_run=args.dry_run)
+    elif args.command == "stats":
+        report = index_stats()
+    elif args.command == "rebuild":
+        report = rebuild(
+            m=args.m,
+            ef_construction=args.ef_construction,
+            ef_search=args.ef_search,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            drop_old=args.drop_old
+        )
+    elif args.command == "bench-scoped":
+        report = bench_scoped(args.chunks, chunks_per_item=args.chunks_per_item, queries=args.queries)
+    elif args.command == "compress-content":
+        report = compress_content(batch_size=args.batch_size)
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import zlib
+from typing import Iterable, Iterator, List, NamedTuple, Union
+from logger import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bump when the stored layout changes; readers reject versions they do not know
+CONTENT_FORMAT_VERSION = 1
+# Text shorter than this is stored as-is; compression would not pay off
+COMPRESS_MIN_CHARS = 512
+# Characters of content kept uncompressed for list views
+PREVIEW_CHARS = 300
+
+class StoredContent(NamedTuple):
+    """Item content as written to the items table."""
+    value: Union[str, bytes, bytearray]
+    encoding: str
+    preview: str
+    length: int
+
+def _compressobj(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return zlib.compressobj(6)
+
+def preferred_encoding() -> str:
+    """zstd when the zstandard package is installed, zlib otherwise."""
+    return "zstd" if zstandard is not None else "zlib"
+
+class ContentWriter:
+    """
+    Accumulates streamed text for storage, switching to incremental
+    compression once it grows past COMPRESS_MIN_CHARS so large pages are
+    never held uncompressed.
+    """
+
+    def __init__(self, threshold: int = COMPRESS_MIN_CHARS, encoding: str = None):
+        self.threshold = threshold
+        self.encoding = encoding or preferred_encoding()
+        self._parts: List[str] = []
+        self._length = 0
+        self._preview = ""
+        self._compressor = None
+        # Grown in place and handed over as-is so finish() never copies it
+        self._compressed = bytearray()
+        self._started = False
+
+    def write(self, text: str):
+        if len(self._preview) < PREVIEW_CHARS:
+            self._preview += text[:PREVIEW_CHARS - len(self._preview)]
+        self._length += len(text)
+        if self._compressor:
+            self._compressed += self._compressor.compress(text.encode("utf-8"))
+            return
+        self._parts.append(text)
+        if self._length >= self.threshold:
+            self._compressor = _compressobj(self.encoding)
+            self._compressed += self._compressor.compress("".join(self._parts).encode("utf-8"))
+            self._parts = []
+
+    def tee(self, fragments: Iterable[str]) -> Iterator[str]:
+        """Pass fragments through, storing them space-joined."""
+        for fragment in fragments:
+            self.write((" " + fragment) if self._started else fragment)
+            self._started = True
+            yield fragment
+
+    def finish(self) -> StoredContent:
+        if self._compressor:
+            self._compressed += self._compressor.flush()
+            return StoredContent(self._compressed, self.encoding, self._preview, self._length)
+        return StoredContent("".join(self._parts), "identity", self._preview, self._length)
+
+def encode_content(text: str) -> StoredContent:
+    """Encode a complete text for storage."""
+    writer = ContentWriter()
+    writer.write(text)
+    return writer.finish()
+
+def decode_content(value: Union[str, bytes], encoding: str, content_format: int = CONTENT_FORMAT_VERSION) -> str:
+    """Decode a stored content value back to text."""
+    if content_format != CONTENT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported content format version: {content_format}")
+    if encoding == "identity":
+        return value
+    if encoding == "zlib":
+        return zlib.decompress(value).decode("utf-8")
+    if encoding == "zstd":
+        if zstandard is None:
+            logger.error("zstd-compressed content found but zstandard is not installed")
+            raise ValueError("zstandard is required to read this content")
+        # Streamed frames carry no content size, so decompress as a stream
+        return zstandard.ZstdDecompressor().decompressobj().decompress(value).decode("utf-8")
+    raise ValueError(f"Unknown content encoding: {encoding}")
@@ -1,66 +1,210 @@
+import codecs
+import os
+import re
 import requests
-from bs4 import BeautifulSoup
-from typing import Optional
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
 from logger import logger
+from dotenv import load_dotenv
+
+# The global fetcher below is built at import, before rag_pipeline loads .env
+load_dotenv()
+
+# Leading bytes scanned for a <meta> charset when the response header has none
+META_SNIFF_BYTES = 1024
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([A-Za-z0-9_.:-]+)", re.IGNORECASE)
+
+def _sniff_meta_charset(head: bytes) -> str:
+    """Return the charset a page declares in a <meta> tag, or utf-8."""
+    match = _META_CHARSET.search(head)
+    if match:
+        try:
+            name = codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            return "utf-8"
+        # As browsers do: latin-1 labels mean windows-1252, and a UTF-16
+        # label cannot be right for a page whose meta tag parsed as ASCII
+        if name == "latin-1":
+            return "cp1252"
+        if name.startswith("utf-16"):
+            return "utf-8"
+        return name
+    return "utf-8"
+
+class FetchError(Exception):
+    """Raised when a URL cannot be fetched or yields no usable text."""
+
+class _TextExtractor(HTMLParser):
+    """Incremental HTML-to-text parser that drops non-content elements."""
+
+    SKIP_TAGS = {"script", "style", "nav", "footer", "header"}
+    # Runs without whitespace longer than this are emitted anyway to bound memory
+    MAX_PENDING_CHARS = 4096
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._words: List[str] = []
+        # Trailing word of the last text run; it may continue in the next feed
+        self._pending = ""
+
+    def _flush_pending(self):
+        if self._pending:
+            self._words.append(self._pending)
+            self._pending = ""
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_pending()
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush_pending()
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_comment(self, data):
+        self._flush_pending()
+
+    def handle_data(self, data):
+        if self._skip_depth or not data:
+            return
+        if self._pending and not data[0].isspace():
+            data = self._pending + data
+            self._pending = ""
+        else:
+            self._flush_pending()
+        words = data.split()
+        if words and not data[-1].isspace() and len(words[-1]) < self.MAX_PENDING_CHARS:
+            self._pending = words.pop()
+        self._words.extend(words)
+
+    def close(self):
+        super().close()
+        self._flush_pending()
+
+    def pop_text(self) -> str:
+        """Return the whitespace-normalised complete words parsed so far and reset."""
+        text = " ".join(self._words)
+        self._words = []
+        return text
 
 class ContentFetcher:
     """Fetch and extract content from URLs."""
-    
-    def __init__(self, timeout: int = 10):
+
+    def __init__(self, timeout: int = 10, max_bytes: Optional[int] = None, read_size: int = 64 * 1024):
         self.timeout = timeout
+        # Read per instance rather than once as a default argument
+        if max_bytes is None:
+            max_bytes = int(os.getenv("FETCH_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.max_bytes = max_bytes
+        self.read_size = read_size
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-    
-    def fetch_url_content(self, url: str) -> str:
+
+    @staticmethod
+    def _decoder(encoding: str):
+        try:
+            return codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            logger.warning(f"Unknown charset {encoding}, decoding as utf-8")
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def iter_url_text(self, url: str) -> Iterator[str]:
         """
-        Fetch and extract text content from a URL.
-        
+        Stream a URL and yield extracted text fragments as they are parsed.
+
+        The body is read in fixed-size blocks and never held in full, so
+        memory stays bounded by read_size regardless of page size. Fragments
+        are whitespace-normalised and meant to be joined with a single space.
+
         Args:
             url: The URL to fetch content from
-            
-        Returns:
-            Extracted text content
-            
+
+        Yields:
+            Extracted text fragments
+
         Raises:
-            Exception: If fetching or parsing fails
+            FetchError: If fetching fails or the body exceeds max_bytes
         """
         try:
-            logger.info(f"Fetching content from URL: {url}")
-            
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # Parse HTML content
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
-            
-            # Get text content
-            text = soup.get_text(separator=' ', strip=True)
-            
-            # Clean up whitespace
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            if not text:
-                raise ValueError("No text content extracted from URL")
-            
-            logger.info(f"Successfully fetched {len(text)} characters from {url}")
-            return text
-            
+            logger.info(f"Streaming content from URL: {url}")
+
+            with requests.get(url, headers=self.headers, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise FetchError(f"Content too large ({length} bytes, limit {self.max_bytes})")
+
+                content_type = response.headers.get("Content-Type", "")
+                charset = response.encoding if "charset=" in content_type.lower() else None
+                decoder = None
+                head = b""
+                parser = _TextExtractor()
+
+                received = 0
+                for block in response.iter_content(chunk_size=self.read_size):
+                    received += len(block)
+                    if received > self.max_bytes:
+                        raise FetchError(f"Content too large (over {self.max_bytes} bytes)")
+                    if decoder is None:
+                        # Without a header charset, hold back the first bytes
+                        # until a <meta> declaration can be sniffed from them
+                        head += block
+                        if not charset and len(head) < META_SNIFF_BYTES:
+                            continue
+                        decoder = self._decoder(charset or _sniff_meta_charset(head))
+                        block, head = head, b""
+                    parser.feed(decoder.decode(block))
+                    text = parser.pop_text()
+                    if text:
+                        yield text
+
+                if decoder is None:
+                    decoder = self._decoder(charset or _sniff_meta_charset(head))
+                    parser.feed(decoder.decode(head))
+                parser.feed(decoder.decode(b"", final=True))
+                parser.close()
+                text = parser.pop_text()
+                if text:
+                    yield text
+
+            logger.info(f"Finished streaming {received} bytes from {url}")
+
+        except FetchError as e:
+            logger.error(f"Rejected URL {url}: {str(e)}")
+            raise
         except requests.exceptions.Timeout:
             logger.error(f"Timeout fetching URL: {url}")
-            raise Exception(f"Request timeout while fetching {url}")
+            raise FetchError(f"Request timeout while fetching {url}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error fetching URL {url}: {str(e)}")
-            raise Exception(f"Failed to fetch URL: {str(e)}")
+            raise FetchError(f"Failed to fetch URL: {str(e)}")
         except Exception as e:
             logger.error(f"Error processing URL {url}: {str(e)}")
-            raise Exception(f"Failed to process URL content: {str(e)}")
+            raise FetchError(f"Failed to process URL content: {str(e)}")
+
+    def fetch_url_content(self, url: str) -> str:
+        """
+        Fetch and extract text content from a URL.
+
+        Args:
+            url: The URL to fetch content from
+
+        Returns:
+            Extracted text content
+
+        Raises:
+            FetchError: If fetching or parsing fails
+        """
+        text = " ".join(self.iter_url_text(url))
+        if not text:
+            raise FetchError("No text content extracted from URL")
+
+        logger.info(f"Successfully fetched {len(text)} characters from {url}")
+        return text
 
 # Global fetcher instance
 fetcher = ContentFetcher()
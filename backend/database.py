@@ -1,9 +1,28 @@
 import sqlite3
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Union
 import json
+from content_codec import (
+    COMPRESS_MIN_CHARS, CONTENT_FORMAT_VERSION, PREVIEW_CHARS, StoredContent,
+    decode_content, encode_content, preferred_encoding
+)
 from logger import logger
 
+# Background outbox replay leaves fresh intents to the request that recorded them
+INTENT_GRACE_SECONDS = 30
+# Rows decoded per transaction when backfilling list-view columns
+BACKFILL_BATCH_SIZE = 200
+
+def _decode_row(row: sqlite3.Row) -> Dict:
+    item = dict(row)
+    item["content"] = decode_content(
+        item["content"],
+        item.pop("content_encoding", "identity"),
+        item.pop("content_format", CONTENT_FORMAT_VERSION)
+    )
+    return item
+
 class Database:
     """SQLite database manager for content metadata."""
     
@@ -27,6 +46,58 @@ class Database:
                 )
             """)
             
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(items)")}
+            if "content_encoding" not in columns:
+                cursor.execute("ALTER TABLE items ADD COLUMN content_encoding TEXT NOT NULL DEFAULT 'identity'")
+            if "content_format" not in columns:
+                cursor.execute(f"ALTER TABLE items ADD COLUMN content_format INTEGER NOT NULL DEFAULT {CONTENT_FORMAT_VERSION}")
+            if "preview" not in columns:
+                cursor.execute("ALTER TABLE items ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+            if "content_length" not in columns:
+                cursor.execute("ALTER TABLE items ADD COLUMN content_length INTEGER")
+            
+            # Backfill list-view columns for rows written before they existed,
+            # a page at a time so large tables are never loaded whole
+            while True:
+                cursor.execute(
+                    """SELECT id, content, content_encoding, content_format FROM items
+                       WHERE content_length IS NULL LIMIT ?""",
+                    (BACKFILL_BATCH_SIZE,)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for item_id, value, encoding, content_format in rows:
+                    text = decode_content(value, encoding, content_format)
+                    cursor.execute(
+                        "UPDATE items SET preview = ?, content_length = ? WHERE id = ?",
+                        (text[:PREVIEW_CHARS], len(text), item_id)
+                    )
+                conn.commit()
+            
+            # Intent log for vector store writes; rows are removed once applied
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS index_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    item_id TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    next_attempt_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            outbox_columns = {row[1] for row in cursor.execute("PRAGMA table_info(index_outbox)")}
+            if "next_attempt_at" not in outbox_columns:
+                cursor.execute("ALTER TABLE index_outbox ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            
             conn.commit()
             conn.close()
             logger.info("Database initialized successfully")
@@ -34,18 +105,30 @@ class Database:
             logger.error(f"Database initialization failed: {str(e)}")
             raise
     
-    def add_item(self, item_id: str, content: str, source_type: str, url: Optional[str] = None) -> Dict:
-        """Add a new item to the database."""
+    def add_item(self, item_id: str, content: Union[str, StoredContent], source_type: str, url: Optional[str] = None,
+                 timestamp: Optional[str] = None, pending_intent: Optional[Dict] = None) -> Dict:
+        """
+        Add a new item and its pending index intent in one transaction.
+        
+        Plain text is compressed here; streaming ingests pass the already
+        encoded StoredContent. They also record the intent up front and pass
+        it as pending_intent, since their chunks are written before the row.
+        """
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            timestamp = datetime.utcnow().isoformat()
+            timestamp = timestamp or datetime.utcnow().isoformat()
+            stored = encode_content(content) if isinstance(content, str) else content
             
             cursor.execute(
-                "INSERT INTO items (id, content, source_type, url, timestamp) VALUES (?, ?, ?, ?, ?)",
-                (item_id, content, source_type, url, timestamp)
+                """INSERT INTO items
+                   (id, content, source_type, url, timestamp, content_encoding, content_format, preview, content_length)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (item_id, stored.value, source_type, url, timestamp, stored.encoding,
+                 CONTENT_FORMAT_VERSION, stored.preview, stored.length)
             )
+            intent = pending_intent or self._record_intent(cursor, item_id, "index", timestamp)
             
             conn.commit()
             conn.close()
@@ -54,23 +137,27 @@ class Database:
             
             return {
                 "id": item_id,
-                "content": content,
+                "preview": stored.preview,
+                "content_length": stored.length,
                 "source_type": source_type,
                 "url": url,
-                "timestamp": timestamp
+                "timestamp": timestamp,
+                "intent": intent
             }
         except Exception as e:
             logger.error(f"Failed to add item: {str(e)}")
             raise
     
     def get_all_items(self) -> List[Dict]:
-        """Retrieve all items from the database."""
+        """Retrieve all items without their content bodies (see get_item_content)."""
         try:
             conn = sqlite3.connect(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            cursor.execute("SELECT * FROM items ORDER BY timestamp DESC")
+            cursor.execute(
+                "SELECT id, preview, content_length, source_type, url, timestamp FROM items ORDER BY timestamp DESC"
+            )
             rows = cursor.fetchall()
             
             items = [dict(row) for row in rows]
@@ -82,6 +169,41 @@ class Database:
             logger.error(f"Failed to retrieve items: {str(e)}")
             raise
     
+    def search_items(self, query: str) -> List[Dict]:
+        """
+        Retrieve items whose full content or URL contains query, case-insensitively.
+        
+        Rows are streamed from the cursor and decoded one at a time, so only
+        the matching summaries are held in memory.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            needle = query.lower()
+            cursor.execute(
+                """SELECT id, preview, content_length, source_type, url, timestamp,
+                          content, content_encoding, content_format
+                   FROM items ORDER BY timestamp DESC"""
+            )
+            items = []
+            for row in cursor:
+                item = dict(row)
+                value = item.pop("content")
+                encoding = item.pop("content_encoding")
+                content_format = item.pop("content_format")
+                url = item["url"] or ""
+                if needle in url.lower() or needle in decode_content(value, encoding, content_format).lower():
+                    items.append(item)
+            conn.close()
+            
+            logger.info(f"Search matched {len(items)} items")
+            return items
+        except Exception as e:
+            logger.error(f"Failed to search items: {str(e)}")
+            raise
+    
     def get_item_by_id(self, item_id: str) -> Optional[Dict]:
         """Retrieve a specific item by ID."""
         try:
@@ -95,14 +217,66 @@ class Database:
             conn.close()
             
             if row:
-                return dict(row)
+                return _decode_row(row)
             return None
         except Exception as e:
             logger.error(f"Failed to retrieve item {item_id}: {str(e)}")
             raise
     
-    def delete_item(self, item_id: str) -> bool:
-        """Delete an item from the database."""
+    def get_item_content(self, item_id: str) -> Optional[str]:
+        """Retrieve and decode the full content of one item."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT content, content_encoding, content_format FROM items WHERE id = ?",
+                (item_id,)
+            )
+            row = cursor.fetchone()
+            
+            conn.close()
+            
+            if row:
+                return decode_content(*row)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to retrieve content for item {item_id}: {str(e)}")
+            raise
+    
+    def recompress_items(self, batch_size: int = 500) -> int:
+        """Re-encode rows written uncompressed or with another codec, then VACUUM."""
+        encoding = preferred_encoding()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        rewritten = 0
+        while True:
+            cursor.execute(
+                """SELECT id, content, content_encoding, content_format FROM items
+                   WHERE content_encoding != ? AND (content_encoding != 'identity' OR content_length >= ?)
+                   LIMIT ?""",
+                (encoding, COMPRESS_MIN_CHARS, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for item_id, value, old_encoding, content_format in rows:
+                stored = encode_content(decode_content(value, old_encoding, content_format))
+                cursor.execute(
+                    "UPDATE items SET content = ?, content_encoding = ?, content_format = ? WHERE id = ?",
+                    (stored.value, stored.encoding, CONTENT_FORMAT_VERSION, item_id)
+                )
+            conn.commit()
+            rewritten += len(rows)
+        
+        # Return the freed pages to the filesystem
+        cursor.execute("VACUUM")
+        conn.close()
+        logger.info(f"Recompressed {rewritten} items")
+        return rewritten
+    
+    def delete_item(self, item_id: str) -> Dict:
+        """Delete an item and record a pending vector store delete intent."""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -110,7 +284,9 @@ class Database:
             cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
             deleted = cursor.rowcount > 0
             
-            conn.commit()
+            if deleted:
+                intent = self._record_intent(cursor, item_id, "delete", datetime.utcnow().isoformat())
+                conn.commit()
             conn.close()
             
             if deleted:
@@ -119,10 +295,177 @@ class Database:
                 logger.warning(f"Item not found for deletion: {item_id}")
                 raise ValueError(f"Item {item_id} not found")
             
-            return deleted
+            return intent
         except Exception as e:
             logger.error(f"Failed to delete item {item_id}: {str(e)}")
             raise
+    
+    def discard_item(self, item_id: str):
+        """Remove an item row without recording an intent (ingest rollback)."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.info(f"Item discarded: {item_id}")
+        except Exception as e:
+            logger.error(f"Failed to discard item {item_id}: {str(e)}")
+            raise
+    
+    def iter_item_ids(self, page_size: int = 1000) -> Iterator[str]:
+        """Yield all item ids, paging through the table by primary key."""
+        last_id = ""
+        while True:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM items WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, page_size)
+            )
+            rows = cursor.fetchall()
+            conn.close()
+            
+            if not rows:
+                return
+            for (item_id,) in rows:
+                yield item_id
+            last_id = rows[-1][0]
+    
+    def get_items_by_ids(self, item_ids: List[str]) -> List[Dict]:
+        """Retrieve the items matching the given ids."""
+        if not item_ids:
+            return []
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            placeholders = ",".join("?" for _ in item_ids)
+            cursor.execute(f"SELECT * FROM items WHERE id IN ({placeholders})", list(item_ids))
+            items = [_decode_row(row) for row in cursor.fetchall()]
+            
+            conn.close()
+            return items
+        except Exception as e:
+            logger.error(f"Failed to retrieve items by id: {str(e)}")
+            raise
+    
+    def record_intent(self, item_id: str, operation: str, lease_seconds: float = INTENT_GRACE_SECONDS) -> Dict:
+        """Record a standalone vector store intent, held from replay for lease_seconds."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        intent = self._record_intent(cursor, item_id, operation, datetime.utcnow().isoformat(), lease_seconds)
+        conn.commit()
+        conn.close()
+        return intent
+    
+    def _record_intent(self, cursor: sqlite3.Cursor, item_id: str, operation: str, created_at: str,
+                       lease_seconds: float = INTENT_GRACE_SECONDS) -> Dict:
+        cursor.execute(
+            "INSERT INTO index_outbox (item_id, operation, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+            (item_id, operation, created_at, time.time() + lease_seconds)
+        )
+        return {"id": cursor.lastrowid, "item_id": item_id, "operation": operation}
+    
+    def get_pending_intents(self, after_id: int = 0, limit: int = 100, due_before: Optional[float] = None) -> List[Dict]:
+        """
+        Retrieve unapplied vector store intents, oldest first. With due_before,
+        only intents whose next attempt is due by then are returned.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                """SELECT id, item_id, operation, attempts FROM index_outbox
+                   WHERE id > ? AND next_attempt_at <= ? ORDER BY id LIMIT ?""",
+                (after_id, due_before if due_before is not None else float("inf"), limit)
+            )
+            intents = [dict(row) for row in cursor.fetchall()]
+            
+            conn.close()
+            return intents
+        except Exception as e:
+            logger.error(f"Failed to retrieve pending intents: {str(e)}")
+            raise
+    
+    def get_pending_item_ids(self) -> set:
+        """Item ids with an unapplied intent, i.e. writes still in flight."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT item_id FROM index_outbox")
+        item_ids = {row[0] for row in cursor.fetchall()}
+        conn.close()
+        return item_ids
+    
+    def get_latest_intent_id(self) -> int:
+        """Id of the newest intent recorded so far (0 if none)."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM index_outbox")
+        latest = cursor.fetchone()[0]
+        conn.close()
+        return latest
+    
+    def count_leased_intents(self, up_to_id: int) -> int:
+        """
+        Number of intents recorded at or before up_to_id that are still held
+        by the request applying them (never attempted by replay, lease live).
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM index_outbox WHERE id <= ? AND attempts = 0 AND next_attempt_at > ?",
+            (up_to_id, time.time())
+        )
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    def complete_intent(self, intent_id: int):
+        """Remove an intent once the vector store reflects it."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM index_outbox WHERE id = ?", (intent_id,))
+        conn.commit()
+        conn.close()
+    
+    def fail_intent(self, intent_id: int, error: str, retry_at: float):
+        """Keep an intent for replay at retry_at, recording why it failed."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE index_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (error, retry_at, intent_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def get_setting(self, key: str) -> Optional[str]:
+        """Read a value from the settings table."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+    
+    def set_setting(self, key: str, value: str):
+        """Write a value to the settings table."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+        conn.commit()
+        conn.close()
+        logger.info(f"Setting updated: {key}={value}")
 
 # Global database instance
 db = Database()
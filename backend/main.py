@@ -1,6 +1,8 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import router
+from outbox import replay_outbox, run_outbox_worker
 from logger import logger
 
 # Create FastAPI app
@@ -22,14 +24,21 @@ app.add_middleware(
 # Include routes
 app.include_router(router)
 
+outbox_task = None
+
 @app.on_event("startup")
 async def startup_event():
-    """Log startup event."""
+    """Replay unapplied vector store writes, start the outbox worker and log startup event."""
+    global outbox_task
+    replay_outbox()
+    outbox_task = asyncio.create_task(run_outbox_worker())
     logger.info("AI Knowledge Inbox API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Log shutdown event."""
+    """Stop the outbox worker and log shutdown event."""
+    if outbox_task:
+        outbox_task.cancel()
     logger.info("AI Knowledge Inbox API shutting down")
 
 if __name__ == "__main__":
@@ -28,9 +28,10 @@ class IngestResponse(BaseModel):
     timestamp: datetime
 
 class Item(BaseModel):
-    """Model for a saved content item."""
+    """Model for a saved content item; the full body is served by ItemContent."""
     id: str
-    content: str
+    preview: str
+    content_length: int
     source_type: str
     url: Optional[str] = None
     timestamp: datetime
@@ -38,6 +39,11 @@ class Item(BaseModel):
     class Config:
         from_attributes = True
 
+class ItemContent(BaseModel):
+    """Full content of a saved item, fetched on demand."""
+    id: str
+    content: str
+
 class QueryRequest(BaseModel):
     """Request model for querying the knowledge base."""
     question: str = Field(..., min_length=1, description="Question to ask")
@@ -50,6 +56,19 @@ class QueryRequest(BaseModel):
             raise ValueError("Question cannot be empty")
         return v.strip()
 
+class BatchQueryRequest(BaseModel):
+    """Request model for running many questions in one call."""
+    questions: List[str] = Field(..., min_length=1, max_length=100, description="Questions to ask")
+    item_id: Optional[str] = Field(None, description="Optional: query specific item only")
+    
+    @validator('questions')
+    def validate_questions(cls, v):
+        """Validate no question is empty."""
+        questions = [q.strip() for q in v]
+        if any(not q for q in questions):
+            raise ValueError("Questions cannot be empty")
+        return questions
+
 class Source(BaseModel):
     """Model for a source citation."""
     content: str
@@ -63,6 +82,14 @@ class QueryResponse(BaseModel):
     sources: List[Source]
     question: str
 
+class BatchQueryResult(BaseModel):
+    """One streamed line of a batch query response."""
+    index: int
+    question: str
+    answer: Optional[str] = None
+    sources: List[Source] = []
+    error: Optional[str] = None
+
 class ErrorResponse(BaseModel):
     """Standard error response."""
     error: str
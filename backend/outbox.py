@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Dict
+from database import db
+from rag_pipeline import rag
+from logger import logger
+
+# How often the service replays due intents in the background
+OUTBOX_POLL_SECONDS = 15
+# Failed intents are retried after RETRY_BASE_SECONDS * 2**attempts, capped
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+
+def apply_intent(intent: Dict) -> bool:
+    """
+    Bring the vector store in line with one recorded intent.
+
+    An "index" intent re-indexes the item if it still exists in SQLite and
+    otherwise purges any chunks a failed ingest left behind, so replaying an
+    intent any number of times converges on the same state.
+
+    Returns:
+        True if the intent was applied and removed from the outbox
+    """
+    item_id = intent["item_id"]
+    try:
+        if intent["operation"] == "index":
+            item = db.get_item_by_id(item_id)
+            if item:
+                rag.add_document(
+                    doc_id=item_id,
+                    content=item["content"],
+                    metadata={
+                        "source_type": item["source_type"],
+                        "url": item["url"],
+                        "timestamp": item["timestamp"]
+                    }
+                )
+            else:
+                rag.delete_document(item_id)
+        elif intent["operation"] == "delete":
+            rag.delete_document(item_id)
+        else:
+            raise ValueError(f"Unknown intent operation: {intent['operation']}")
+
+        db.complete_intent(intent["id"])
+        return True
+    except Exception as e:
+        logger.error(f"Failed to apply {intent['operation']} intent for {item_id}: {str(e)}")
+        delay = min(RETRY_BASE_SECONDS * 2 ** intent.get("attempts", 0), RETRY_MAX_SECONDS)
+        db.fail_intent(intent["id"], str(e), retry_at=time.time() + delay)
+        return False
+
+def replay_outbox(batch_size: int = 100) -> Dict[str, int]:
+    """Apply every intent that is due, once, oldest first."""
+    applied = failed = 0
+    last_id = 0
+    now = time.time()
+    while True:
+        intents = db.get_pending_intents(after_id=last_id, limit=batch_size, due_before=now)
+        if not intents:
+            break
+        for intent in intents:
+            if apply_intent(intent):
+                applied += 1
+            else:
+                failed += 1
+            last_id = intent["id"]
+
+    if applied or failed:
+        logger.info(f"Outbox replay: {applied} applied, {failed} failed")
+    return {"applied": applied, "failed": failed}
+
+async def run_outbox_worker(interval: float = OUTBOX_POLL_SECONDS):
+    """Replay due intents periodically so failed writes converge without a restart."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(replay_outbox)
+        except Exception as e:
+            logger.error(f"Outbox replay failed: {str(e)}")
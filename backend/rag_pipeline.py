@@ -1,5 +1,10 @@
 import os
-from typing import List, Dict, Optional, TypedDict, Literal
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, TypedDict, Literal
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
@@ -7,11 +12,23 @@ from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import END, StateGraph
+from database import db
 from logger import logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DEFAULT_COLLECTION = "knowledge_inbox"
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# How often to check whether an admin rebuild swapped the active collection
+COLLECTION_REFRESH_SECONDS = 2.0
+# Per-item chunk embedding matrices kept for item-scoped queries
+ITEM_CACHE_SIZE = 64
+# Bounds staleness from writes made by other processes (e.g. admin reconcile)
+ITEM_CACHE_TTL_SECONDS = 60.0
+# Chunks embedded and written per call when indexing a document
+EMBED_BATCH_SIZE = 64
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph.
@@ -26,23 +43,32 @@ class GraphState(TypedDict):
     retries: int
 
 class RAGPipeline:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, top_k: int = 3):
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, top_k: int = 3,
+                 max_llm_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.top_k = top_k
+        self.max_llm_concurrency = max_llm_concurrency
+        # Shared by every graph run so batch queries cannot flood the LLM API
+        self.llm_semaphore = threading.BoundedSemaphore(max_llm_concurrency)
+        # (event loop, asyncio.Semaphore) bounding batch graphs parked in worker threads
+        self._batch_gate = None
         
-        logger.info("Loading embedding model...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._index = None
+        self._index_checked_at = 0.0
+        self._index_lock = threading.Lock()
+        self._item_cache: "OrderedDict[Tuple[str, str], Tuple]" = OrderedDict()
+        self._item_cache_lock = threading.Lock()
+        self._item_cache_epoch = 0
         
         logger.info("Initializing ChromaDB...")
+        self.persist_path = "./chroma_db"
         self.chroma_client = chromadb.PersistentClient(
-            path="./chroma_db",
+            path=self.persist_path,
             settings=Settings(anonymized_telemetry=False)
         )
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="knowledge_inbox",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self._active_index()
         
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
@@ -57,6 +83,54 @@ class RAGPipeline:
         self.app = self.build_graph()
         logger.info("LangGraph Pipeline initialized")
 
+    def _load_model(self, model_name: str) -> SentenceTransformer:
+        if model_name not in self._models:
+            logger.info(f"Loading embedding model {model_name}...")
+            self._models[model_name] = SentenceTransformer(model_name)
+        return self._models[model_name]
+
+    def _active_index(self):
+        """
+        Return the (collection, embedding_model) pair currently in service.
+        
+        Admin rebuilds swap collections by updating the "active_collection"
+        setting; each collection records the model its vectors came from.
+        """
+        now = time.monotonic()
+        if self._index is not None and now - self._index_checked_at < COLLECTION_REFRESH_SECONDS:
+            return self._index
+        
+        with self._index_lock:
+            name = db.get_setting("active_collection") or DEFAULT_COLLECTION
+            if self._index is None or self._index[0].name != name:
+                # get_or_create_collection overwrites an existing collection's
+                # metadata (HNSW params, embedding model), so only the default
+                # collection is ever created here, on first start
+                try:
+                    collection = self.chroma_client.get_collection(name=name)
+                except ValueError:
+                    if name != DEFAULT_COLLECTION:
+                        raise
+                    collection = self.chroma_client.get_or_create_collection(
+                        name=name,
+                        metadata={"hnsw:space": "cosine"}
+                    )
+                model_name = (collection.metadata or {}).get("embedding_model", DEFAULT_EMBEDDING_MODEL)
+                model = self._load_model(model_name)
+                self._models = {model_name: model}
+                self._index = (collection, model)
+                logger.info(f"Serving collection {name} ({model_name})")
+            self._index_checked_at = now
+            return self._index
+
+    @property
+    def collection(self):
+        return self._active_index()[0]
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        return self._active_index()[1]
+
     def chunk_text(self, text: str) -> List[str]:
         chunks = []
         start = 0
@@ -69,74 +143,290 @@ class RAGPipeline:
             start += self.chunk_size - self.chunk_overlap
         return chunks
 
+    def iter_chunks(self, fragments: Iterable[str]) -> Iterator[str]:
+        """
+        Streaming form of chunk_text over text arriving in space-joined
+        fragments. Yields the same chunks chunk_text would for the joined
+        text while only buffering about one chunk.
+        """
+        step = self.chunk_size - self.chunk_overlap
+        buffer = ""
+        started = False
+        for fragment in fragments:
+            buffer += (" " + fragment) if started else fragment
+            started = True
+            start = 0
+            while len(buffer) - start >= self.chunk_size:
+                chunk = buffer[start:start + self.chunk_size].strip()
+                if chunk:
+                    yield chunk
+                start += step
+            buffer = buffer[start:]
+        
+        start = 0
+        while start < len(buffer):
+            chunk = buffer[start:start + self.chunk_size].strip()
+            if chunk:
+                yield chunk
+            start += step
+
+    def _chunk_records(self, doc_id: str, chunks: List[str], metadata: Dict, start: int = 0) -> Tuple[List[str], List[Dict]]:
+        chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(start, start + len(chunks))]
+        chunk_metadata = []
+        for i in range(start, start + len(chunks)):
+            meta = {
+                "chunk_index": i,
+                "parent_doc_id": str(doc_id),
+                "source_type": str(metadata.get("source_type", "unknown"))
+            }
+            if "url" in metadata and metadata["url"]:
+                meta["url"] = str(metadata["url"])
+            if "timestamp" in metadata and metadata["timestamp"]:
+                meta["timestamp"] = str(metadata["timestamp"])
+            chunk_metadata.append(meta)
+        return chunk_ids, chunk_metadata
+
     def add_document(self, doc_id: str, content: str, metadata: Dict):
+        self.add_document_stream(doc_id, [content], metadata)
+
+    def add_document_stream(self, doc_id: str, fragments: Iterable[str], metadata: Dict,
+                            batch_size: int = EMBED_BATCH_SIZE) -> int:
+        """
+        Chunk, embed and write a document in bounded batches as its text
+        arrives, so memory does not grow with document size.
+        
+        Returns:
+            Number of chunks written
+        """
         try:
-            chunks = self.chunk_text(content)
-            embeddings = self.embedding_model.encode(chunks).tolist()
-            chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-            chunk_metadata = []
-            for i in range(len(chunks)):
-                meta = {
-                    "chunk_index": i,
-                    "parent_doc_id": str(doc_id),
-                    "source_type": str(metadata.get("source_type", "unknown"))
-                }
-                if "url" in metadata and metadata["url"]:
-                    meta["url"] = str(metadata["url"])
-                if "timestamp" in metadata and metadata["timestamp"]:
-                    meta["timestamp"] = str(metadata["timestamp"])
-                chunk_metadata.append(meta)
+            collection, embedding_model = self._active_index()
+            written = 0
+            batch: List[str] = []
             
-            self.collection.add(
-                ids=chunk_ids,
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=chunk_metadata
-            )
-            logger.info(f"Added document {doc_id} with {len(chunks)} chunks")
+            def flush():
+                chunk_ids, chunk_metadata = self._chunk_records(doc_id, batch, metadata, start=written)
+                # Chunk ids are deterministic, so upsert makes replays idempotent
+                collection.upsert(
+                    ids=chunk_ids,
+                    embeddings=embedding_model.encode(batch).tolist(),
+                    documents=batch,
+                    metadatas=chunk_metadata
+                )
+            
+            for chunk in self.iter_chunks(fragments):
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    flush()
+                    written += len(batch)
+                    batch = []
+            if batch:
+                flush()
+                written += len(batch)
+            
+            self._invalidate_items([doc_id])
+            logger.info(f"Added document {doc_id} with {written} chunks")
+            return written
         except Exception as e:
             logger.error(f"Failed to add document: {e}")
             raise
 
+    def add_documents(self, items: List[Dict], batch_size: int = EMBED_BATCH_SIZE):
+        """
+        Index several items (database rows), embedding and writing chunks in
+        batches of batch_size that span item boundaries.
+        """
+        try:
+            collection, embedding_model = self._active_index()
+            ids: List[str] = []
+            chunks: List[str] = []
+            metadatas: List[Dict] = []
+            total = 0
+            
+            def flush():
+                collection.upsert(
+                    ids=ids,
+                    embeddings=embedding_model.encode(chunks).tolist(),
+                    documents=chunks,
+                    metadatas=metadatas
+                )
+            
+            for item in items:
+                for index, chunk in enumerate(self.iter_chunks([item["content"]])):
+                    chunk_ids, chunk_metadata = self._chunk_records(item["id"], [chunk], item, start=index)
+                    ids.extend(chunk_ids)
+                    chunks.append(chunk)
+                    metadatas.extend(chunk_metadata)
+                    if len(chunks) >= batch_size:
+                        flush()
+                        total += len(chunks)
+                        ids, chunks, metadatas = [], [], []
+            if chunks:
+                flush()
+                total += len(chunks)
+            
+            self._invalidate_items([item["id"] for item in items])
+            logger.info(f"Added {len(items)} documents with {total} chunks")
+        except Exception as e:
+            logger.error(f"Failed to add documents: {e}")
+            raise
+
     def delete_document(self, doc_id: str):
         try:
-            results = self.collection.get(where={"parent_doc_id": str(doc_id)})
+            collection = self.collection
+            results = collection.get(where={"parent_doc_id": str(doc_id)})
             if results and results['ids']:
-                self.collection.delete(ids=results['ids'])
+                collection.delete(ids=results['ids'])
                 logger.info(f"Deleted document {doc_id}")
+            self._invalidate_items([doc_id])
         except Exception as e:
             logger.error(f"Failed to delete document: {e}")
             raise
 
+    def delete_documents(self, doc_ids: List[str]):
+        """Delete every chunk belonging to any of the given documents."""
+        try:
+            self.collection.delete(where={"parent_doc_id": {"$in": [str(d) for d in doc_ids]}})
+            self._invalidate_items(doc_ids)
+            logger.info(f"Deleted {len(doc_ids)} documents")
+        except Exception as e:
+            logger.error(f"Failed to delete documents: {e}")
+            raise
 
+    def iter_parent_doc_ids(self, page_size: int = 1000):
+        """Yield the distinct parent_doc_id of every chunk, one page at a time."""
+        collection = self.collection
+        seen = set()
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            if not page['ids']:
+                return
+            for meta in page['metadatas']:
+                parent_id = meta.get("parent_doc_id") if meta else None
+                if parent_id and parent_id not in seen:
+                    seen.add(parent_id)
+                    yield parent_id
+            offset += len(page['ids'])
 
-    def retrieve(self, state: GraphState):
-        logger.info("---RETRIEVE---")
-        question = state["question"]
-        item_id = state.get("item_id")
-        
-        query_embedding = self.embedding_model.encode([question]).tolist()
-        where_filter = {"parent_doc_id": str(item_id)} if item_id else None
+
+
+    def _invalidate_items(self, doc_ids: List[str]):
+        doc_ids = {str(d) for d in doc_ids}
+        with self._item_cache_lock:
+            self._item_cache_epoch += 1
+            for key in [k for k in self._item_cache if k[1] in doc_ids]:
+                del self._item_cache[key]
+
+    def _item_chunks(self, collection, item_id: str) -> Tuple[np.ndarray, List[str], List[Dict]]:
+        """Load (and LRU-cache) one item's unit-normalised chunk embeddings."""
+        key = (collection.name, str(item_id))
+        with self._item_cache_lock:
+            cached = self._item_cache.get(key)
+            if cached and time.monotonic() - cached[0] < ITEM_CACHE_TTL_SECONDS:
+                self._item_cache.move_to_end(key)
+                return cached[1]
+            epoch = self._item_cache_epoch
         
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=self.top_k,
-            where=where_filter
+        results = collection.get(
+            where={"parent_doc_id": str(item_id)},
+            include=["embeddings", "documents", "metadatas"]
         )
+        embeddings = results['embeddings'] if results['embeddings'] is not None else []
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if len(matrix):
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        entry = (matrix, results['documents'] or [], results['metadatas'] or [])
+        
+        # Skip caching when the item has no chunks (it may be re-indexed
+        # elsewhere) or when an invalidation ran while we were loading
+        with self._item_cache_lock:
+            if len(matrix) and epoch == self._item_cache_epoch:
+                self._item_cache[key] = (time.monotonic(), entry)
+                self._item_cache.move_to_end(key)
+                while len(self._item_cache) > ITEM_CACHE_SIZE:
+                    self._item_cache.popitem(last=False)
+        return entry
+
+    def query_item_chunks(self, collection, query_embeddings: List[List[float]], item_id: str) -> Dict:
+        """
+        Exact top-k over a single item's chunks, shaped like collection.query().
         
+        An item has at most a few dozen chunks, so a dot product against its
+        cached embedding matrix beats a filtered ANN search over the whole
+        collection and never misses a chunk. Cosine ranking matches the
+        collection's "hnsw:space".
+        """
+        matrix, documents, metadatas = self._item_chunks(collection, item_id)
+        results = {"documents": [], "metadatas": []}
+        for query in query_embeddings:
+            if not documents:
+                results["documents"].append([])
+                results["metadatas"].append([])
+                continue
+            query = np.asarray(query, dtype=np.float32)
+            scores = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+            top = np.argsort(-scores)[:self.top_k]
+            results["documents"].append([documents[i] for i in top])
+            results["metadatas"].append([metadatas[i] for i in top])
+        return results
+
+    def _format_results(self, results: Dict, index: int = 0) -> Tuple[List[str], List[Dict]]:
         documents = []
         sources = []
-        if results['documents'] and results['documents'][0]:
-            for i in range(len(results['documents'][0])):
-                doc_content = results['documents'][0][i]
+        if results['documents'] and results['documents'][index]:
+            for i in range(len(results['documents'][index])):
+                doc_content = results['documents'][index][i]
                 documents.append(doc_content)
                 
-                source_meta = results['metadatas'][0][i].copy()
+                source_meta = results['metadatas'][index][i].copy()
                 source_meta['content'] = doc_content
                 sources.append(source_meta)
-                
+        return documents, sources
+
+    def retrieve_batch(self, questions: List[str], item_id: Optional[str] = None) -> List[Tuple[List[str], List[Dict]]]:
+        """Embed all questions in one pass and run a single multi-embedding query."""
+        collection, embedding_model = self._active_index()
+        query_embeddings = embedding_model.encode(questions).tolist()
+        
+        if item_id:
+            results = self.query_item_chunks(collection, query_embeddings, item_id)
+        else:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=self.top_k
+            )
+        logger.info(f"Retrieved context for {len(questions)} questions in one query")
+        return [self._format_results(results, i) for i in range(len(questions))]
+
+    def retrieve(self, state: GraphState):
+        logger.info("---RETRIEVE---")
+        # Batch runs arrive with their context already retrieved
+        if state.get("documents") is not None:
+            return {"documents": state["documents"], "sources": state.get("sources") or []}
+        
+        question = state["question"]
+        item_id = state.get("item_id")
+        
+        collection, embedding_model = self._active_index()
+        query_embedding = embedding_model.encode([question]).tolist()
+        
+        if item_id:
+            results = self.query_item_chunks(collection, query_embedding, item_id)
+        else:
+            results = collection.query(
+                query_embeddings=query_embedding,
+                n_results=self.top_k
+            )
+        
+        documents, sources = self._format_results(results)
         return {"documents": documents, "sources": sources}
 
+    def _invoke_llm(self, system: str, human: str) -> str:
+        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
+        chain = prompt | self.llm | StrOutputParser()
+        with self.llm_semaphore:
+            return chain.invoke({})
+
     def generate(self, state: GraphState):
         logger.info("---GENERATE---")
         question = state["question"]
@@ -165,9 +455,7 @@ class RAGPipeline:
         {question}
         """
         
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        chain = prompt | self.llm | StrOutputParser()
-        generation = chain.invoke({})
+        generation = self._invoke_llm(system, human)
         
         return {"generation": generation, "retries": retries + 1}
 
@@ -191,9 +479,7 @@ class RAGPipeline:
         Is the answer grounded in the facts? Give a binary 'YES' or 'NO' score.
         """
         
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        chain = prompt | self.llm | StrOutputParser()
-        score = chain.invoke({})
+        score = self._invoke_llm(system, human)
         
         grounded = "YES" in score.upper()
         logger.info(f"Grounded: {grounded}")
@@ -214,9 +500,7 @@ class RAGPipeline:
         
         Does the answer resolve the question? Give a binary 'YES' or 'NO' score.
         """
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        chain = prompt | self.llm | StrOutputParser()
-        score = chain.invoke({})
+        score = self._invoke_llm(system, human)
         
         useful = "YES" in score.upper()
         logger.info(f"Useful: {useful}")
@@ -274,9 +558,12 @@ class RAGPipeline:
         
         return workflow.compile()
 
-    def run_graph(self, question: str, item_id: Optional[str] = None):
+    def run_graph(self, question: str, item_id: Optional[str] = None,
+                  context: Optional[Tuple[List[str], List[Dict]]] = None):
         """Entry point for the API"""
         inputs = {"question": question, "item_id": item_id, "retries": 0}
+        if context is not None:
+            inputs["documents"], inputs["sources"] = context
         config = {"recursion_limit": 25}
         
         result = self.app.invoke(inputs, config=config)
@@ -286,4 +573,46 @@ class RAGPipeline:
             "sources": result.get("sources", [])
         }
 
+    def _get_batch_gate(self) -> asyncio.Semaphore:
+        """
+        Return the gate shared by every batch request on the running loop.
+        
+        Graphs wait on it in the event loop rather than in to_thread workers,
+        so concurrent batches hold at most max_llm_concurrency pool threads
+        and leave the rest of the pool to other routes. Created lazily since
+        the pipeline is built before the loop exists.
+        """
+        loop = asyncio.get_running_loop()
+        if self._batch_gate is None or self._batch_gate[0] is not loop:
+            self._batch_gate = (loop, asyncio.Semaphore(self.max_llm_concurrency))
+        return self._batch_gate[1]
+
+    async def run_graph_batch(self, questions: List[str], contexts: List[Tuple[List[str], List[Dict]]],
+                              item_id: Optional[str] = None):
+        """
+        Run one graph per question concurrently, yielding (index, result, error)
+        tuples in completion order.
+        """
+        gate = self._get_batch_gate()
+        
+        async def run_one(index: int, question: str, context: Tuple[List[str], List[Dict]]):
+            async with gate:
+                try:
+                    result = await asyncio.to_thread(self.run_graph, question, item_id, context)
+                    return index, result, None
+                except Exception as e:
+                    logger.error(f"Batch question {index} failed: {e}")
+                    return index, None, e
+        
+        tasks = [
+            asyncio.create_task(run_one(i, question, context))
+            for i, (question, context) in enumerate(zip(questions, contexts))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
 rag = RAGPipeline()
@@ -1,15 +1,61 @@
 from fastapi import APIRouter, HTTPException, status
-from models import IngestRequest, IngestResponse, QueryRequest, QueryResponse, Item, ErrorResponse
+from fastapi.responses import StreamingResponse
+from models import (
+    IngestRequest, IngestResponse, QueryRequest, QueryResponse, BatchQueryRequest,
+    BatchQueryResult, Item, ItemContent, ErrorResponse
+)
 from database import db
-from content_fetcher import fetcher
+from content_codec import ContentWriter
+from content_fetcher import fetcher, FetchError
 from rag_pipeline import rag
+from outbox import apply_intent
 from logger import logger
+import asyncio
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
 
 router = APIRouter(prefix="/api")
 
+# Outbox replay leaves a streaming ingest's intent alone for this long, so it
+# cannot purge chunks that are still being written before the row exists
+STREAM_INGEST_LEASE_SECONDS = 600
+
+def _ingest_url_stream(item_id: str, url: str) -> Dict:
+    """
+    Fetch a URL and index it chunk batch by chunk batch as text arrives,
+    storing the text (compressed when oversized) once the stream ends.
+    
+    Chunks land in Chroma before the SQLite row exists, so the index intent
+    is recorded first; on failure, applying it purges the partial chunks.
+    """
+    intent = db.record_intent(item_id, "index", lease_seconds=STREAM_INGEST_LEASE_SECONDS)
+    timestamp = datetime.utcnow().isoformat()
+    writer = ContentWriter()
+    try:
+        chunk_count = rag.add_document_stream(
+            doc_id=item_id,
+            fragments=writer.tee(fetcher.iter_url_text(url)),
+            metadata={"source_type": "url", "url": url, "timestamp": timestamp}
+        )
+        if not chunk_count:
+            raise FetchError("No text content extracted from URL")
+        
+        db_item = db.add_item(
+            item_id=item_id,
+            content=writer.finish(),
+            source_type="url",
+            url=url,
+            timestamp=timestamp,
+            pending_intent=intent
+        )
+    except Exception:
+        apply_intent(intent)
+        raise
+    
+    db.complete_intent(intent["id"])
+    return db_item
+
 @router.post("/ingest", response_model=IngestResponse, status_code=status.HTTP_201_CREATED)
 async def ingest_content(request: IngestRequest):
     """
@@ -17,29 +63,38 @@ async def ingest_content(request: IngestRequest):
     """
     try:
         item_id = str(uuid.uuid4())
-        content = request.content
-        url = None
         
-        # Fetch URL content if needed
+        # URLs are streamed straight into the vector store
         if request.source_type == "url":
-            url = request.content
             try:
-                content = fetcher.fetch_url_content(url)
-            except Exception as e:
+                db_item = await asyncio.to_thread(_ingest_url_stream, item_id, request.content)
+            except FetchError as e:
                 logger.error(f"URL fetch failed: {str(e)}")
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"Failed to fetch URL content: {str(e)}"
                 )
-        elif request.source_type == "note" and request.url:
-            # Support optional URL for notes
-            url = request.url
+            except Exception as e:
+                logger.error(f"Streaming ingest failed: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to index content in vector store"
+                )
+            return IngestResponse(
+                id=item_id,
+                message="Content ingested successfully",
+                source_type=request.source_type,
+                timestamp=datetime.fromisoformat(db_item["timestamp"])
+            )
+        
+        # Support optional URL for notes
+        url = request.url
         
         # Store in database
         try:
             db_item = db.add_item(
                 item_id=item_id,
-                content=content,
+                content=request.content,
                 source_type=request.source_type,
                 url=url
             )
@@ -50,19 +105,14 @@ async def ingest_content(request: IngestRequest):
                 detail="Failed to store content in database"
             )
         
-        # Index in vector store
-        try:
-            rag.add_document(
-                doc_id=item_id,
-                content=content,
-                metadata={
-                    "source_type": request.source_type,
-                    "url": url,
-                    "timestamp": db_item["timestamp"]
-                }
-            )
-        except Exception as e:
-            logger.error(f"Vector indexing failed: {str(e)}")
+        # Index in vector store; the pending intent lets a later replay
+        # finish the job if we crash before this completes
+        if not apply_intent(db_item["intent"]):
+            try:
+                db.discard_item(item_id)
+                apply_intent(db_item["intent"])
+            except Exception as e:
+                logger.error(f"Ingest rollback failed: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to index content in vector store"
@@ -85,17 +135,22 @@ async def ingest_content(request: IngestRequest):
         )
 
 @router.get("/items", response_model=List[Item])
-async def get_items():
+async def get_items(q: Optional[str] = None):
     """
-    Retrieve all saved items.
+    Retrieve all saved items, or only those whose content or URL contains q.
     """
     try:
-        items = db.get_all_items()
+        if q and q.strip():
+            # Every matching candidate is decompressed, so keep it off the event loop
+            items = await asyncio.to_thread(db.search_items, q.strip())
+        else:
+            items = db.get_all_items()
         
         return [
             Item(
                 id=item["id"],
-                content=item["content"],
+                preview=item["preview"],
+                content_length=item["content_length"],
                 source_type=item["source_type"],
                 url=item["url"],
                 timestamp=datetime.fromisoformat(item["timestamp"])
@@ -110,6 +165,27 @@ async def get_items():
             detail="Failed to retrieve items"
         )
 
+@router.get("/items/{item_id}/content", response_model=ItemContent)
+async def get_item_content(item_id: str):
+    """
+    Retrieve the full content of one item.
+    """
+    try:
+        content = db.get_item_content(item_id)
+    except Exception as e:
+        logger.error(f"Failed to retrieve item content: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve item content"
+        )
+    
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not found"
+        )
+    return ItemContent(id=item_id, content=content)
+
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(item_id: str):
     """
@@ -118,7 +194,7 @@ async def delete_item(item_id: str):
     try:
         # Delete from database
         try:
-            db.delete_item(item_id)
+            intent = db.delete_item(item_id)
         except Exception as e:
             logger.error(f"Database deletion failed: {str(e)}")
             raise HTTPException(
@@ -126,11 +202,8 @@ async def delete_item(item_id: str):
                 detail="Item not found"
             )
         
-        # Delete from vector store
-        try:
-            rag.delete_document(item_id)
-        except Exception as e:
-            logger.error(f"Vector store deletion failed: {str(e)}")
+        # Delete from vector store; on failure the intent stays queued for replay
+        apply_intent(intent)
         
         return None
         
@@ -149,8 +222,8 @@ async def query_knowledge(request: QueryRequest):
     Query the knowledge base using the LangGraph RAG pipeline.
     """
     try:
-        # Run LangGraph pipeline
-        result = rag.run_graph(request.question, item_id=request.item_id)
+        # Run LangGraph pipeline off the event loop; it may wait on the shared LLM semaphore
+        result = await asyncio.to_thread(rag.run_graph, request.question, item_id=request.item_id)
         
         return QueryResponse(
             answer=result["answer"],
@@ -166,6 +239,40 @@ async def query_knowledge(request: QueryRequest):
             detail=f"An error occurred: {str(e)}"
         )
 
+@router.post("/query/batch")
+async def query_knowledge_batch(request: BatchQueryRequest):
+    """
+    Run many questions in one request. Retrieval is done in a single pass and
+    results are streamed back as newline-delimited JSON as each graph completes.
+    """
+    try:
+        contexts = await asyncio.to_thread(rag.retrieve_batch, request.questions, request.item_id)
+    except Exception as e:
+        logger.error(f"Batch retrieval failed: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {str(e)}"
+        )
+    
+    async def stream_results():
+        async for index, result, error in rag.run_graph_batch(request.questions, contexts, item_id=request.item_id):
+            question = request.questions[index]
+            if error is not None:
+                line = BatchQueryResult(index=index, question=question, error=str(error))
+            else:
+                try:
+                    line = BatchQueryResult(
+                        index=index,
+                        question=question,
+                        answer=result["answer"],
+                        sources=result["sources"]
+                    )
+                except Exception as e:
+                    line = BatchQueryResult(index=index, question=question, error=str(e))
+            yield line.model_dump_json() + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import sentence_transformers
+
+class StubEncoder:
+    """Stands in for SentenceTransformer so tests need no model download."""
+
+    def __init__(self, model_name: str = "stub", *args, **kwargs):
+        self.model_name = model_name
+
+    def encode(self, texts):
+        return np.zeros((len(texts), 384), dtype=np.float32)
+
+# The backend modules build their singletons (SQLite file, Chroma client,
+# embedding model) at import time, so stub and isolate before importing them.
+sentence_transformers.SentenceTransformer = StubEncoder
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.chdir(tempfile.mkdtemp(prefix="knowledge_inbox_tests_"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
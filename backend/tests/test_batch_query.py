@@ -0,0 +1,33 @@
+import asyncio
+import threading
+import time
+from rag_pipeline import rag
+
+def test_concurrent_batches_share_one_thread_gate(monkeypatch):
+    running = peak = 0
+    lock = threading.Lock()
+
+    def fake_run_graph(question, item_id=None, context=None):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return {"answer": question, "sources": []}
+
+    monkeypatch.setattr(rag, "run_graph", fake_run_graph)
+
+    async def one_batch(tag):
+        questions = [f"{tag}-{i}" for i in range(6)]
+        return [result async for result in rag.run_graph_batch(questions, [([], [])] * len(questions))]
+
+    async def main():
+        return await asyncio.gather(*(one_batch(tag) for tag in "abc"))
+
+    batches = asyncio.run(main())
+
+    assert all(error is None for batch in batches for _, _, error in batch)
+    assert sum(len(batch) for batch in batches) == 18
+    assert peak <= rag.max_llm_concurrency
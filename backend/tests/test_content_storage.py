@@ -0,0 +1,48 @@
+import sqlite3
+import database
+from database import Database
+from content_codec import PREVIEW_CHARS
+
+def _legacy_db(path, count):
+    """Create an items table as written before the content columns existed."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE items (
+            id TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            source_type TEXT NOT NULL,
+            url TEXT,
+            timestamp TEXT NOT NULL
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO items (id, content, source_type, url, timestamp) VALUES (?, ?, ?, ?, ?)",
+        [(f"item-{i}", f"legacy note {i} " * 50, "note", None, f"2024-01-01T00:00:{i:02d}")
+         for i in range(count)]
+    )
+    conn.commit()
+    conn.close()
+
+def test_init_db_backfills_in_pages(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    _legacy_db(path, 25)
+    monkeypatch.setattr(database, "BACKFILL_BATCH_SIZE", 4)
+
+    items = {item["id"]: item for item in Database(path).get_all_items()}
+
+    assert len(items) == 25
+    expected = "legacy note 7 " * 50
+    assert items["item-7"]["content_length"] == len(expected)
+    assert items["item-7"]["preview"] == expected[:PREVIEW_CHARS]
+
+def test_search_matches_compressed_content_past_preview(tmp_path):
+    db = Database(str(tmp_path / "search.db"))
+    filler = "lorem ipsum dolor sit amet " * 100
+    db.add_item("deep", filler + "Zeppelin", "note")
+    db.add_item("shallow", filler, "url", url="https://example.com/zeppelin-history")
+    db.add_item("other", filler, "note")
+
+    assert len(filler) > PREVIEW_CHARS
+    assert {item["id"] for item in db.search_items("zeppelin")} == {"deep", "shallow"}
+    assert "content" not in db.search_items("ZEPPELIN")[0]
+    assert db.search_items("absent") == []
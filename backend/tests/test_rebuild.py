@@ -0,0 +1,29 @@
+import pytest
+import admin
+import rag_pipeline
+from database import db
+from rag_pipeline import rag, DEFAULT_COLLECTION
+
+@pytest.fixture
+def restore_active_collection():
+    yield
+    db.set_setting("active_collection", DEFAULT_COLLECTION)
+    rag._index_checked_at = 0.0
+
+def test_rebuild_swap_keeps_model_and_hnsw_settings(monkeypatch, restore_active_collection):
+    monkeypatch.setattr(admin, "COLLECTION_REFRESH_SECONDS", 0)
+    monkeypatch.setattr(rag_pipeline, "COLLECTION_REFRESH_SECONDS", 0)
+    item = db.add_item("rebuild-item", "a note about rebuilding the vector index " * 40, "note")
+    rag.add_document(doc_id="rebuild-item", content=db.get_item_content("rebuild-item"), metadata={"source_type": "note"})
+    db.complete_intent(item["intent"]["id"])
+
+    report = admin.rebuild(m=32, ef_search=50, model_name="stub-model")
+
+    metadata = rag.collection.metadata
+    assert rag.collection.name != DEFAULT_COLLECTION
+    assert rag.embedding_model.model_name == "stub-model"
+    assert metadata["embedding_model"] == "stub-model"
+    assert metadata["hnsw:M"] == 32
+    assert metadata["hnsw:search_ef"] == 50
+    assert report["after"]["metadata"]["hnsw:M"] == 32
+    assert report["copied"] > 0
@@ -0,0 +1,145 @@
+import random
+import tracemalloc
+import pytest
+import content_fetcher
+from conftest import StubEncoder
+from content_codec import ContentWriter
+from content_fetcher import ContentFetcher, _TextExtractor
+from rag_pipeline import rag, EMBED_BATCH_SIZE
+
+PAGE_BYTES = 20 * 1024 * 1024
+PEAK_LIMIT_BYTES = 8 * 1024 * 1024
+# Peak minus the compressed content that has to be kept for storage
+WORKING_SET_LIMIT_BYTES = 2 * 1024 * 1024
+
+class FileResponse:
+    """Minimal streamed requests.Response backed by a local file."""
+
+    def __init__(self, path, content_type="text/html; charset=utf-8", encoding="utf-8"):
+        self.path = path
+        self.headers = {"Content-Type": content_type}
+        self.encoding = encoding
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    return
+                yield block
+
+class CountingCollection:
+    """Records upsert sizes without keeping anything."""
+
+    name = "knowledge_inbox"
+
+    def __init__(self):
+        self.chunks = 0
+        self.largest_batch = 0
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.chunks += len(ids)
+        self.largest_batch = max(self.largest_batch, len(ids))
+
+@pytest.fixture
+def huge_page(tmp_path):
+    path = tmp_path / "huge.html"
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(2000)]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><style>p { color: red; }</style><script>var skipped = 1;</script></head><body>")
+        written = 0
+        while written < PAGE_BYTES:
+            paragraph = "<p>" + " ".join(rng.choice(words) for _ in range(200)) + " café</p>\n"
+            f.write(paragraph)
+            written += len(paragraph)
+        f.write("</body></html>")
+    return path
+
+def test_streaming_ingest_peak_memory(huge_page, monkeypatch):
+    monkeypatch.setattr(content_fetcher.requests, "get", lambda url, **kwargs: FileResponse(huge_page))
+    collection = CountingCollection()
+    monkeypatch.setattr(rag, "_active_index", lambda: (collection, StubEncoder()))
+    fetcher = ContentFetcher()
+    writer = ContentWriter()
+
+    tracemalloc.start()
+    try:
+        written = rag.add_document_stream(
+            doc_id="huge",
+            fragments=writer.tee(fetcher.iter_url_text("http://example.test/huge")),
+            metadata={"source_type": "url"}
+        )
+        stored = writer.finish()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert written == collection.chunks > 0
+    assert collection.largest_batch <= EMBED_BATCH_SIZE
+    assert stored.length > PAGE_BYTES // 2
+    assert "skipped" not in stored.preview
+    assert peak < PEAK_LIMIT_BYTES, f"peak traced memory {peak} bytes"
+    assert peak - len(stored.value) < WORKING_SET_LIMIT_BYTES, f"working set {peak - len(stored.value)} bytes"
+
+def test_extractor_keeps_words_across_block_boundaries():
+    html = ("<p>supercalifragilistic expialidocious</p>foo<b>bar</b> baz &amp; qux<!-- c -->end"
+            "<script>ignored()</script>tail café") * 5
+
+    def extract(block_size):
+        parser = _TextExtractor()
+        parts = []
+        for start in range(0, len(html), block_size):
+            parser.feed(html[start:start + block_size])
+            parts.append(parser.pop_text())
+        parser.close()
+        parts.append(parser.pop_text())
+        return " ".join(part for part in parts if part)
+
+    expected = extract(len(html))
+    assert "supercalifragilistic expialidocious foo bar baz & qux end tail café" in expected
+    for block_size in (1, 7, 37):
+        assert extract(block_size) == expected
+
+@pytest.mark.parametrize("declaration", [
+    '<meta charset="iso-8859-1">',
+    '<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">',
+])
+def test_fetcher_honours_meta_charset(tmp_path, monkeypatch, declaration):
+    path = tmp_path / "latin1.html"
+    path.write_bytes(f"<html><head>{declaration}</head><body><p>café naïve</p></body></html>".encode("iso-8859-1"))
+    # requests reports ISO-8859-1 for any text/* response without a charset
+    monkeypatch.setattr(content_fetcher.requests, "get",
+                        lambda url, **kwargs: FileResponse(path, "text/html", "ISO-8859-1"))
+
+    for read_size in (7, 64 * 1024):
+        fetcher = ContentFetcher(read_size=read_size)
+        assert fetcher.fetch_url_content("http://example.test/latin1") == "café naïve"
+
+def test_fetcher_defaults_to_utf8_without_declaration(tmp_path, monkeypatch):
+    path = tmp_path / "plain.html"
+    path.write_bytes("<p>café naïve</p>".encode("utf-8"))
+    monkeypatch.setattr(content_fetcher.requests, "get",
+                        lambda url, **kwargs: FileResponse(path, "text/html", "ISO-8859-1"))
+
+    assert ContentFetcher(read_size=3).fetch_url_content("http://example.test/plain") == "café naïve"
+
+def test_fetch_max_bytes_read_at_construction(monkeypatch):
+    monkeypatch.setenv("FETCH_MAX_BYTES", "123")
+    assert ContentFetcher().max_bytes == 123
+
+def test_iter_chunks_matches_chunk_text():
+    rng = random.Random(1)
+    for _ in range(50):
+        fragments = ["".join(rng.choice("ab  c") for _ in range(rng.randint(1, 1500))).strip() or "x"
+                     for _ in range(rng.randint(1, 6))]
+        assert list(rag.iter_chunks(fragments)) == rag.chunk_text(" ".join(fragments))
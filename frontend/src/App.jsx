@@ -3,7 +3,7 @@ import { Brain, Plus, Search, Database, Filter, X, ChevronRight, Settings, Messa
 import IngestForm from './components/IngestForm';
 import ItemsList from './components/ItemsList';
 import QueryModal from './components/QueryModal';
-import { getItems, healthCheck, deleteItem } from './api';
+import { getItems, searchItems, healthCheck, deleteItem } from './api';
 
 function App() {
     const [items, setItems] = useState([]);
@@ -14,6 +14,7 @@ function App() {
     const [showAddForm, setShowAddForm] = useState(false);
     const [filterType, setFilterType] = useState('all');
     const [searchQuery, setSearchQuery] = useState('');
+    const [searchResults, setSearchResults] = useState(null);
     const [sidebarOpen, setSidebarOpen] = useState(true);
 
     const fetchItems = async () => {
@@ -45,8 +46,32 @@ function App() {
     }, []);
 
 
+    // Search runs server-side over full content, debounced while typing
     useEffect(() => {
-        let filtered = items;
+        const query = searchQuery.trim();
+        if (!query) {
+            setSearchResults(null);
+            return;
+        }
+
+        let cancelled = false;
+        const timer = setTimeout(async () => {
+            try {
+                const data = await searchItems(query);
+                if (!cancelled) setSearchResults(data);
+            } catch (error) {
+                console.error('Failed to search items:', error);
+            }
+        }, 250);
+
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [items, searchQuery]);
+
+    useEffect(() => {
+        let filtered = searchResults ?? items;
 
         if (filterType === 'note') {
             filtered = filtered.filter(item => item.source_type === 'note');
@@ -58,15 +83,8 @@ function App() {
             );
         }
 
-        if (searchQuery.trim()) {
-            filtered = filtered.filter(item =>
-                item.content.toLowerCase().includes(searchQuery.toLowerCase()) ||
-                (item.url && item.url.toLowerCase().includes(searchQuery.toLowerCase()))
-            );
-        }
-
         setFilteredItems(filtered);
-    }, [items, filterType, searchQuery]);
+    }, [items, filterType, searchResults]);
 
     const handleIngestSuccess = () => {
         fetchItems();
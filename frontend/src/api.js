@@ -46,6 +46,16 @@ export const getItems = async () => {
     return response.data;
 };
 
+export const searchItems = async (query) => {
+    const response = await api.get('/items', { params: { q: query } });
+    return response.data;
+};
+
+export const getItemContent = async (itemId) => {
+    const response = await api.get(`/items/${itemId}/content`);
+    return response.data;
+};
+
 export const queryKnowledge = async (question, itemId = null) => {
     const response = await api.post('/query', {
         question,
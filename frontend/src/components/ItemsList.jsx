@@ -89,7 +89,7 @@ const ItemsList = ({ items, loading, onItemClick, onDelete }) => {
                             </div>
                         ) : (
                             <p className="text-text-primary text-sm leading-relaxed line-clamp-4 font-normal">
-                                {item.content}
+                                {item.preview}
                             </p>
                         )}
                     </div>
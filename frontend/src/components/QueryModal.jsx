@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { X, Search, FileText, Link as LinkIcon, Clock, Sparkles, Loader2, Brain } from 'lucide-react';
-import { queryKnowledge } from '../api';
+import { queryKnowledge, getItemContent } from '../api';
 // import './QueryModal.css'; // Removed CSS
 
 const QueryModal = ({ item, onClose }) => {
@@ -8,6 +8,22 @@ const QueryModal = ({ item, onClose }) => {
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
     const [result, setResult] = useState(null);
+    const [fullContent, setFullContent] = useState(null);
+    const [contentLoading, setContentLoading] = useState(false);
+
+    const hasMoreContent = item.content_length > item.preview.length;
+
+    const handleShowContent = async () => {
+        setContentLoading(true);
+        try {
+            const data = await getItemContent(item.id);
+            setFullContent(data.content);
+        } catch (err) {
+            setError(err.message);
+        } finally {
+            setContentLoading(false);
+        }
+    };
 
     const handleSubmit = async (e) => {
         e.preventDefault();
@@ -75,9 +91,28 @@ const QueryModal = ({ item, onClose }) => {
                                     </a>
                                 )}
                             </div>
-                            <p className="text-sm text-text-secondary line-clamp-2 leading-relaxed">
-                                {item.content}
-                            </p>
+                            {fullContent !== null ? (
+                                <p className="text-sm text-text-secondary leading-relaxed max-h-48 overflow-y-auto whitespace-pre-wrap">
+                                    {fullContent}
+                                </p>
+                            ) : (
+                                <>
+                                    <p className="text-sm text-text-secondary line-clamp-2 leading-relaxed">
+                                        {item.preview}
+                                    </p>
+                                    {hasMoreContent && (
+                                        <button
+                                            type="button"
+                                            className="mt-2 text-xs font-medium text-accent-blue hover:underline flex items-center gap-1"
+                                            onClick={handleShowContent}
+                                            disabled={contentLoading}
+                                        >
+                                            {contentLoading && <Loader2 size={10} className="animate-spin" />}
+                                            Show full content
+                                        </button>
+                                    )}
+                                </>
+                            )}
                         </div>
                     </div>
 